@@ -54,20 +54,51 @@ CHROMA_CLOUD_TENANT = os.getenv("CHROMA_CLOUD_TENANT")
 CHROMA_CLOUD_DATABASE = os.getenv("CHROMA_CLOUD_DATABASE")
 
 COLLECTION_NAME = "pitchfork_reviews"
+# HNSW tuning for local Chroma, applied only when the collection is first
+# created (Chroma Cloud manages its own index). Larger sync_threshold/batch_size cut how
+# often the index is persisted during bulk upserts.
+COLLECTION_METADATA = {
+    "hnsw:construction_ef": 200,
+    "hnsw:M": 32,
+    "hnsw:search_ef": 64,
+    "hnsw:batch_size": 1000,
+    "hnsw:sync_threshold": 10000,
+}
 EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
 
+# ONNX Runtime INT8 encoder (requires `optimum[onnxruntime]`). Leave USE_ONNX off
+# to keep the FP32 PyTorch model, e.g. when validating recall.
+USE_ONNX = os.getenv("USE_ONNX", "false").lower() == "true"
+ONNX_MODEL_FILE = os.getenv("ONNX_MODEL_FILE", "onnx/model_qint8_avx512_vnni.onnx")
+# CPU intra-op threads for the PyTorch encoders; 0 keeps torch's default (one per
+# physical core). Set it to the container's CPU limit where cgroups hide it.
+TORCH_NUM_THREADS = int(os.getenv("TORCH_NUM_THREADS", "0"))
+
 # --- SCRAPER & DATA CONFIG ---
 RAW_DATA_FILE = DATA_DIR / "reviews.jsonl"
 S3_BUCKET_NAME = "baler-music-chatbot"
 S3_DAILY_PREFIX = "daily_scrapes/"
+S3_DOWNLOAD_WORKERS = 16  # concurrent daily-scrape downloads in update_raw_data
 PROCESSED_FILES_LOG = LOG_DIR / ".processed_s3_files.log"
+PROCESSED_URLS_INDEX = DATA_DIR / "processed_urls.sqlite"  # sidecar for get_processed_urls
+TAG_CACHE_PATH = DATA_DIR / "tag_cache.sqlite"  # (chunk, genres) -> LLM tags
 
 # --- PIPELINE BATCHING ---
 KB_BATCH_SIZE = 50
+KB_FLUSH_ROWS = 2000        # tagged chunks staged before each embed + upsert
 KB_CONCURRENCY_LIMIT = 30
-INTER_BATCH_DELAY_SECONDS = 0
+TAG_BATCH_SIZE = 8          # review chunks tagged per LLM request
+TAG_MAX_RETRIES = 4         # retries per tag request on 429/503 (honours Retry-After)
+EMBED_BATCH_SIZE = 256      # chunks per SentenceTransformer forward pass (CUDA/MPS)
+EMBED_BATCH_SIZE_CPU = 64   # smaller CPU batches keep length-sorted padding tight
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "1"))  # >1 enables the multi-process encode pool
+EMBED_POOL_MIN_ROWS = 256   # smaller flushes skip the pool and encode in-process
 
 # --- RETRIEVAL TUNING ---
 DB_FETCH_BATCH_SIZE = 250   # rows per ChromaDB page fetch
+DB_FETCH_WORKERS = 8        # concurrent ChromaDB page fetches
 RETRIEVAL_CANDIDATE_COUNT = 100  # BM25 + vector candidates before RRF fusion
 RRF_K = 60                  # RRF smoothing constant
+QUERY_EMBEDDING_CACHE_SIZE = 1024  # memoized query embeddings
+RESPONSE_CACHE_SIZE = 256   # completed LLM streams, keyed by query + context albums
+RETRIEVAL_CONCURRENCY = 2   # /recommend retrievals (embed + rerank) run at once per worker
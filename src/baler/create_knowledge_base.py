@@ -1,44 +1,121 @@
 import argparse
 import asyncio
-import json
+import hashlib
 import logging
+import sqlite3
+from pathlib import Path
 
 import httpx
+import orjson
 import pandas as pd
 from tqdm import tqdm
 
 from . import config
 from .database import VectorDB
 from .llm import get_llm_client
-from .utils import chunk_text, parse_json_list
+from .utils import chunk_text, parse_json_list, run_async
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-async def process_chunk_with_semaphore(semaphore, llm, client, chunk, row_data):
+# Columns carried from each review onto its chunks in the knowledge base.
+KB_CHUNK_COLUMNS = [
+    "artist", "album_title", "score", "review_url",
+    "text_chunk", "tags", "artist_genres", "album_cover_url",
+]
+
+
+class TagCache:
+    """
+    Persistent (chunk text, artist genres) -> tags cache, so re-runs and
+    repeated boilerplate chunks don't pay for another LLM call.
+    """
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS tags (key BLOB PRIMARY KEY, tags BLOB)")
+
+    @staticmethod
+    def key(chunk: str, artist_genres) -> bytes:
+        # Genres are part of the tag prompt, so they are part of the key.
+        genres = ",".join(parse_json_list(artist_genres))
+        return hashlib.blake2b(f"{genres}\n{chunk}".encode(), digest_size=16).digest()
+
+    def get_many(self, keys) -> dict[bytes, list[str]]:
+        found = {}
+        unique = list(set(keys))
+        for i in range(0, len(unique), 500):
+            part = unique[i : i + 500]
+            placeholders = ",".join("?" * len(part))
+            rows = self.conn.execute(f"SELECT key, tags FROM tags WHERE key IN ({placeholders})", part)
+            found.update((k, orjson.loads(t)) for k, t in rows)
+        return found
+
+    def put_many(self, items: dict[bytes, list[str]]):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO tags (key, tags) VALUES (?, ?)",
+                ((k, orjson.dumps(t)) for k, t in items.items()),
+            )
+
+    def close(self):
+        self.conn.close()
+
+
+async def process_chunks_with_semaphore(semaphore, llm, client, chunks, artist_genres):
     async with semaphore:
-        genres = parse_json_list(row_data.get("artist_genres"))
-        tags = await llm.generate_tags_for_chunk(client, chunk, genres=genres or None)
-        if tags:
-            return {
-                "artist": row_data["artist"], "album_title": row_data["album_title"],
-                "score": row_data["score"], "review_url": row_data["review_url"],
-                "text_chunk": chunk, "tags": tags,
-                "artist_genres": row_data.get("artist_genres", "[]"),
-                "album_cover_url": row_data.get("album_cover_url", "N/A"),
-            }
-        return None
-
-
-def load_reviews_robustly(file_path):
-    """Reads a JSONL file line by line, skipping any malformed lines."""
-    records = []
+        genres = parse_json_list(artist_genres)
+        return await llm.generate_tags_for_chunks(client, chunks, genres=genres or None)
+
+
+def explode_into_chunks(batch_df: pd.DataFrame, chunk_lists: pd.Series) -> pd.DataFrame:
+    """Returns one row per text chunk, carrying the parent review's columns."""
+    chunks_df = (
+        batch_df.assign(text_chunk=chunk_lists)
+        .explode("text_chunk", ignore_index=True)
+        .dropna(subset=["text_chunk"])
+    )
+    if "artist_genres" not in chunks_df:
+        chunks_df["artist_genres"] = "[]"
+    if "album_cover_url" not in chunks_df:
+        chunks_df["album_cover_url"] = "N/A"
+    return chunks_df
+
+
+# Fields read from each raw review; everything else in the JSONL is dropped.
+REVIEW_FIELDS = (
+    "artist", "album_title", "score", "review_url",
+    "review_text", "artist_genres", "album_cover_url",
+)
+
+
+def load_unprocessed_reviews(file_path, processed_urls: set) -> pd.DataFrame:
+    """
+    Streams a JSONL file of reviews line by line, skipping malformed lines.
+    A later record for the same review_url replaces an earlier one, reviews
+    without an artist are dropped, and URLs already in the knowledge base are
+    skipped, so only the reviews left to process are materialised.
+    """
+    reviews: dict[str, dict] = {}
+    total = 0
     with open(file_path) as f:
         for i, line in enumerate(f):
             try:
-                records.append(json.loads(line))
-            except json.JSONDecodeError:
+                review = orjson.loads(line)
+            except orjson.JSONDecodeError:
                 logging.warning(f"Skipping malformed JSON on line {i+1} in {file_path}")
-    return pd.DataFrame(records)
+                continue
+            total += 1
+            url = review.get("review_url")
+            if not url or url in processed_urls:
+                continue
+            if review.get("artist") == "N/A":
+                reviews.pop(url, None)
+                continue
+            reviews[url] = {k: review[k] for k in REVIEW_FIELDS if k in review}
+
+    logging.info(f"Read {total} records; {len(reviews)} valid, unique reviews are new.")
+    return pd.DataFrame(list(reviews.values()))
+
 
 async def main():
     """Main function to orchestrate the knowledge base build."""
@@ -54,60 +131,140 @@ async def main():
     logging.getLogger("chromadb").setLevel(logging.WARNING)
     logging.getLogger("httpx").setLevel(logging.WARNING)
 
+    # Fail fast: loading the models and scanning the collection both take a while.
+    if not Path(args.input_file).exists():
+        logging.fatal(f"FATAL: Raw data file not found at '{args.input_file}'.")
+        return
+
     try:
         db = VectorDB()
         llm = get_llm_client()
-        logging.info(f"Loading reviews from {args.input_file}...")
-        raw_df = load_reviews_robustly(args.input_file)
-    except FileNotFoundError:
-        logging.fatal(f"FATAL: Raw data file not found at '{args.input_file}'.")
-        return
     except Exception as e:
         logging.fatal(f"Failed to initialize services: {e}")
         return
 
-    logging.info(f"Starting knowledge base build process using {config.LLM_PROVIDER}...")
-    
-    original_count = len(raw_df)
-    logging.info(f"Loaded {original_count} total records.")
+    try:
+        await _build_knowledge_base(db, llm, args.input_file)
+    finally:
+        # Release the LLM client's pooled connections, as the API's shutdown hook does.
+        await llm.aclose()
+
 
-    raw_df.drop_duplicates(subset=["review_url"], keep="last", inplace=True)
-    df = raw_df[raw_df["artist"] != "N/A"].copy()
-    logging.info(f"Filtered down to {len(df)} valid, unique records.")
+async def _build_knowledge_base(db, llm, input_file):
+    """Loads the reviews not yet in the collection, then tags, embeds and stores them."""
+    logging.info(f"Starting knowledge base build process using {config.LLM_PROVIDER}...")
 
     processed_urls = db.get_processed_urls()
     logging.info(f"Found {len(processed_urls)} already processed reviews to skip.")
 
-    unprocessed_df = df[~df["review_url"].isin(processed_urls)]
+    try:
+        logging.info(f"Loading reviews from {input_file}...")
+        unprocessed_df = load_unprocessed_reviews(input_file, processed_urls)
+    except FileNotFoundError:
+        logging.fatal(f"FATAL: Raw data file not found at '{input_file}'.")
+        return
+
     if unprocessed_df.empty:
         logging.info("All reviews in the input file have already been processed. Nothing to do.")
         return
     logging.info(f"Found {len(unprocessed_df)} new reviews to process.")
 
     semaphore = asyncio.Semaphore(config.KB_CONCURRENCY_LIMIT)
+    encode_pool = db.start_encode_pool(config.EMBED_WORKERS) if config.EMBED_WORKERS > 1 else None
+    tag_cache = TagCache(config.TAG_CACHE_PATH)
 
-    with tqdm(total=len(unprocessed_df), desc="Processing reviews") as pbar:
-        for i in range(0, len(unprocessed_df), config.KB_BATCH_SIZE):
-            batch_df = unprocessed_df.iloc[i : i + config.KB_BATCH_SIZE]
-            
-            async with httpx.AsyncClient() as client:
-                tasks = []
-                for _, row in batch_df.iterrows():
-                    text_chunks = chunk_text(row["review_text"])
-                    row_data = row.to_dict()
-                    for chunk in text_chunks:
-                        tasks.append(process_chunk_with_semaphore(semaphore, llm, client, chunk, row_data))
-                
-                results = await asyncio.gather(*tasks)
-                enriched_chunks = [res for res in results if res is not None]
-
-            if enriched_chunks:
-                enriched_batch_df = pd.DataFrame(enriched_chunks)
-                db.add_batch(enriched_batch_df)
-            pbar.update(len(batch_df))
-            await asyncio.sleep(config.INTER_BATCH_DELAY_SECONDS)
+    try:
+        await _process_reviews(db, llm, unprocessed_df, semaphore, encode_pool, tag_cache)
+    finally:
+        tag_cache.close()
+        if encode_pool is not None:
+            db.stop_encode_pool(encode_pool)
 
     logging.info(f"\nKnowledge base update complete. Collection now contains {db.get_count()} items.")
 
+
+async def _process_reviews(db, llm, unprocessed_df, semaphore, encode_pool, tag_cache):
+    """
+    Tags unprocessed reviews in KB_BATCH_SIZE batches. Tagged chunks are staged
+    and embedded/upserted together once KB_FLUSH_ROWS have accumulated, so the
+    encoder and Chroma see a few large writes instead of many small ones.
+    Each flush runs in a worker thread while tagging continues; at most one
+    flush is in flight, so writes stay ordered and staging memory bounded.
+    """
+    staged: list[pd.DataFrame] = []
+    staged_rows = 0
+    in_flight: asyncio.Task | None = None
+
+    async def flush():
+        nonlocal staged_rows, in_flight
+        if in_flight is not None:
+            await in_flight
+            in_flight = None
+        if staged:
+            flush_df = pd.concat(staged, ignore_index=True)
+            staged.clear()
+            staged_rows = 0
+            in_flight = asyncio.create_task(
+                asyncio.to_thread(db.add_batch, flush_df, encode_pool=encode_pool)
+            )
+
+    try:
+        # One pooled client for the whole run so LLM connections survive across batches.
+        limits = httpx.Limits(
+            max_connections=config.KB_CONCURRENCY_LIMIT,
+            max_keepalive_connections=config.KB_CONCURRENCY_LIMIT,
+        )
+        async with httpx.AsyncClient(limits=limits) as client:
+            with tqdm(total=len(unprocessed_df), desc="Processing reviews") as pbar:
+                for i in range(0, len(unprocessed_df), config.KB_BATCH_SIZE):
+                    batch_df = unprocessed_df.iloc[i : i + config.KB_BATCH_SIZE]
+
+                    chunk_lists = batch_df["review_text"].map(chunk_text)
+                    chunks_df = explode_into_chunks(batch_df, chunk_lists)
+                    chunks_df["tag_key"] = [
+                        TagCache.key(chunk, genres)
+                        for chunk, genres in zip(chunks_df["text_chunk"], chunks_df["artist_genres"])
+                    ]
+                    known_tags = tag_cache.get_many(chunks_df["tag_key"])
+
+                    # Only uncached chunks go to the LLM, as one flat task list for the
+                    # batch: each task tags up to TAG_BATCH_SIZE chunks of a single review.
+                    pending = chunks_df[~chunks_df["tag_key"].map(known_tags.__contains__)]
+                    slices = []
+                    for _, group in pending.groupby("review_url", sort=False):
+                        chunks, keys = group["text_chunk"].tolist(), group["tag_key"].tolist()
+                        genres = group["artist_genres"].iat[0]
+                        for j in range(0, len(chunks), config.TAG_BATCH_SIZE):
+                            slices.append((chunks[j : j + config.TAG_BATCH_SIZE], keys[j : j + config.TAG_BATCH_SIZE], genres))
+                    results = await asyncio.gather(*(
+                        process_chunks_with_semaphore(semaphore, llm, client, chunks, genres)
+                        for chunks, _, genres in slices
+                    ))
+                    new_tags = {
+                        key: tags
+                        for (_, keys, _), batch_tags in zip(slices, results)
+                        for key, tags in zip(keys, batch_tags)
+                        if tags
+                    }
+                    tag_cache.put_many(new_tags)
+                    known_tags.update(new_tags)
+                    chunks_df["tags"] = chunks_df["tag_key"].map(lambda k: known_tags.get(k, []))
+
+                    # Chunks the LLM failed to tag are skipped, as before.
+                    enriched_batch_df = chunks_df.loc[chunks_df["tags"].map(bool), KB_CHUNK_COLUMNS]
+                    if not enriched_batch_df.empty:
+                        staged.append(enriched_batch_df)
+                        staged_rows += len(enriched_batch_df)
+                    if staged_rows >= config.KB_FLUSH_ROWS:
+                        await flush()
+                    pbar.update(len(batch_df))
+
+        await flush()
+    finally:
+        # Let a running write finish before the caller tears down the encode pool.
+        if in_flight is not None:
+            await in_flight
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    run_async(main())
@@ -1,11 +1,18 @@
+import functools
 import hashlib
-import json
 import logging
 import re
+import sqlite3
 import threading
 import time
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
 
 import chromadb
+import numpy as np
+import orjson
 import pandas as pd
 import torch
 from rank_bm25 import BM25Okapi
@@ -18,14 +25,45 @@ from .utils import parse_json_list
 # --- HELPER FUNCTION FOR DEVICE SELECTION ---
 def get_optimal_device():
     """Automatically select the best device for SentenceTransformer."""
-    if torch.backends.mps.is_available():
+    if torch.cuda.is_available():
+        logging.info("CUDA GPU is available. Using 'cuda'.")
+        return "cuda"
+    elif torch.backends.mps.is_available():
         logging.info("Apple MPS (GPU) is available. Using 'mps'.")
         return "mps"
     else:
         logging.info("No specialized hardware found. Using 'cpu'.")
+        if config.TORCH_NUM_THREADS > 0:
+            torch.set_num_threads(config.TORCH_NUM_THREADS)
+        logging.info(f"Using {torch.get_num_threads()} CPU thread(s) for inference.")
         return "cpu"
 
 
+def load_embedding_model(device: str) -> SentenceTransformer:
+    """
+    Loads the embedding model, preferring the INT8-quantized ONNX export on CPU
+    and FP16 weights on CUDA. Falls back to the FP32 PyTorch model otherwise.
+    """
+    if config.USE_ONNX and device == "cpu":
+        try:
+            model = SentenceTransformer(
+                config.EMBEDDING_MODEL_NAME,
+                device=device,
+                backend="onnx",
+                model_kwargs={"file_name": config.ONNX_MODEL_FILE},
+            )
+            logging.info(f"Loaded ONNX INT8 embedding model ({config.ONNX_MODEL_FILE}).")
+            return model
+        except Exception as e:
+            logging.warning(f"ONNX embedding model unavailable, using PyTorch FP32: {e}")
+    model = SentenceTransformer(config.EMBEDDING_MODEL_NAME, device=device)
+    if device == "cuda":
+        # FP16 halves memory traffic and runs on tensor cores; recall impact
+        # on MiniLM is negligible.
+        model.half()
+    return model
+
+
 class VectorDB:
     """Handles all interactions with the ChromaDB vector database."""
 
@@ -56,12 +94,29 @@ class VectorDB:
             )
 
         self._wait_for_chroma()
+        try:
+            self.max_batch_size = self.client.get_max_batch_size()
+        except Exception:
+            self.max_batch_size = 100
+        # HNSW tuning only applies to local Chroma; Cloud manages its own index.
+        is_cloud = config.DB_PROVIDER.upper() == "CLOUD"
         self.collection = self.client.get_or_create_collection(
-            name=config.COLLECTION_NAME
+            name=config.COLLECTION_NAME,
+            metadata=None if is_cloud else config.COLLECTION_METADATA,
         )
 
         device = get_optimal_device()
-        self.model = SentenceTransformer(config.EMBEDDING_MODEL_NAME, device=device)
+        self.model = load_embedding_model(device)
+        # Accelerators need wide batches to saturate; CPU throughput is flat in
+        # batch size, so smaller batches just waste less on padding.
+        self.embed_batch_size = (
+            config.EMBED_BATCH_SIZE_CPU if device == "cpu" else config.EMBED_BATCH_SIZE
+        )
+        # Repeated queries (and the second encode in related-artist expansion)
+        # hit this cache instead of re-running the forward pass.
+        self._cached_query_embedding = functools.lru_cache(
+            maxsize=config.QUERY_EMBEDDING_CACHE_SIZE
+        )(self._encode_query)
         self.cross_encoder = CrossEncoder(
             "cross-encoder/ms-marco-MiniLM-L6-v2", device=device
         )
@@ -101,15 +156,8 @@ class VectorDB:
         try:
             all_documents = []
             all_metadatas = []
-            batch_size = config.DB_FETCH_BATCH_SIZE
-
-            for offset in range(0, count, batch_size):
-                logging.info(f"Fetching BM25 corpus batch at offset {offset}...")
-                items = self.collection.get(
-                    limit=batch_size,
-                    offset=offset,
-                    include=["metadatas", "documents"],
-                )
+
+            for items in self._fetch_pages(count, include=["metadatas", "documents"]):
                 if items and items.get("documents"):
                     all_documents.extend(items["documents"])
                     all_metadatas.extend(items["metadatas"])
@@ -121,12 +169,126 @@ class VectorDB:
         except Exception as e:
             logging.error(f"BM25 index build failed: {e}")
 
+    def _fetch_pages(self, count: int, include: list[str]) -> Iterator[dict]:
+        """
+        Yields `count` records in DB_FETCH_BATCH_SIZE pages, in offset order. Pages
+        are independent reads, so up to DB_FETCH_WORKERS of them are fetched ahead
+        of the caller; no more than that are held at once, so callers that only
+        keep part of each page never have the whole collection in memory.
+        """
+        batch_size = config.DB_FETCH_BATCH_SIZE
+
+        def fetch(offset: int) -> dict:
+            logging.info(f"Fetching records from offset {offset}...")
+            return self.collection.get(limit=batch_size, offset=offset, include=include)
+
+        offsets = iter(range(0, count, batch_size))
+        with ThreadPoolExecutor(max_workers=config.DB_FETCH_WORKERS) as pool:
+            # zip pulls from the range first, so no offset is consumed past the window.
+            pending = deque(
+                pool.submit(fetch, offset)
+                for _, offset in zip(range(config.DB_FETCH_WORKERS), offsets)
+            )
+            while pending:
+                page = pending.popleft().result()
+                next_offset = next(offsets, None)
+                if next_offset is not None:
+                    pending.append(pool.submit(fetch, next_offset))
+                yield page
+
+    @torch.inference_mode()
+    def _encode_query(self, normalized_text: str):
+        embedding = np.ascontiguousarray(
+            self.model.encode(
+                [normalized_text], batch_size=1, convert_to_numpy=True, show_progress_bar=False
+            ),
+            dtype=np.float32,
+        )
+        embedding.setflags(write=False)  # shared between callers via the cache
+        return embedding
+
+    def embed_query(self, query_text: str):
+        """
+        Returns the (1, dim) query embedding, memoized on the normalized text.
+        The model's tokenizer is uncased and whitespace-insensitive, so case
+        and spacing are folded into the cache key without changing the vector.
+        """
+        return self._cached_query_embedding(" ".join(query_text.lower().split()))
+
+    def warm_up(self):
+        """
+        Runs one throwaway query through the embedding model, Chroma and the
+        cross-encoder so lazy kernel/threadpool setup happens before the first
+        user request. Bypasses the query-embedding cache. Each step is warmed
+        independently, so one failing doesn't skip the others.
+        """
+        embedding = None
+        try:
+            embedding = self._encode_query("warmup")
+        except Exception as e:
+            logging.warning(f"Embedding model warm-up failed: {e}")
+
+        if embedding is not None:
+            try:
+                # Querying an empty collection can raise; there is nothing to warm then.
+                if self.get_count() > 0:
+                    self.collection.query(
+                        query_embeddings=embedding, n_results=1, include=["metadatas"]
+                    )
+            except Exception as e:
+                logging.warning(f"ChromaDB warm-up failed: {e}")
+
+        try:
+            with torch.inference_mode():
+                self.cross_encoder.predict([("warmup", "warmup")])
+        except Exception as e:
+            logging.warning(f"Cross-encoder warm-up failed: {e}")
+
     def get_count(self) -> int:
         """Returns the total number of items in the collection."""
         return self.collection.count()
 
+    def _open_url_index(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(config.PROCESSED_URLS_INDEX)
+        conn.execute("CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY)")
+        conn.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value INTEGER)")
+        return conn
+
+    def _load_url_index(self, count: int) -> set | None:
+        """
+        Returns the URLs in the local sidecar index, or None if the index was
+        synced at a different collection count (i.e. another machine or the
+        nightly pipeline has written to the collection since).
+        """
+        with closing(self._open_url_index()) as conn:
+            row = conn.execute("SELECT value FROM state WHERE key = 'count'").fetchone()
+            if row is None or row[0] != count:
+                return None
+            return {url for (url,) in conn.execute("SELECT url FROM urls")}
+
+    def _save_url_index(self, urls, count: int, previous_count: int | None = None):
+        """
+        Writes URLs to the sidecar index and records the collection count they
+        correspond to. With previous_count=None the index is replaced outright;
+        otherwise the URLs are appended only if the index was in sync at
+        previous_count, so a partial index is never marked as current.
+        """
+        with closing(self._open_url_index()) as conn, conn:
+            if previous_count is None:
+                conn.execute("DELETE FROM urls")
+            else:
+                row = conn.execute("SELECT value FROM state WHERE key = 'count'").fetchone()
+                if row is None or row[0] != previous_count:
+                    return
+            conn.executemany("INSERT OR IGNORE INTO urls (url) VALUES (?)", ((u,) for u in urls))
+            conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('count', ?)", (count,))
+
     def get_processed_urls(self) -> set:
-        """Returns a set of all review_urls already in the database."""
+        """
+        Returns a set of all review_urls already in the database. Served from
+        the local sidecar index when it is in sync with the collection count;
+        otherwise rebuilt from a full metadata scan.
+        """
         try:
             count = self.get_count()
             logging.info(
@@ -135,21 +297,27 @@ class VectorDB:
             if count == 0:
                 return set()
 
+            try:
+                cached = self._load_url_index(count)
+            except sqlite3.Error as e:
+                logging.warning(f"Could not read processed URL index: {e}")
+                cached = None
+            if cached is not None:
+                logging.info(f"Loaded {len(cached)} processed URLs from local index.")
+                return cached
+
             all_urls = set()
-            batch_size = config.DB_FETCH_BATCH_SIZE
-            for offset in range(0, count, batch_size):
-                logging.info(f"Fetching records from offset {offset}...")
-                items = self.collection.get(
-                    limit=batch_size,
-                    offset=offset,
-                    include=["metadatas"],
-                )
+            for items in self._fetch_pages(count, include=["metadatas"]):
                 if items and items["metadatas"]:
                     for meta in items["metadatas"]:
                         if "review_url" in meta:
                             all_urls.add(meta["review_url"])
 
             logging.info(f"Total unique URLs found in database: {len(all_urls)}")
+            try:
+                self._save_url_index(all_urls, count)
+            except sqlite3.Error as e:
+                logging.warning(f"Could not write processed URL index: {e}")
             return all_urls
         except Exception as e:
             logging.error(f"Error getting processed URLs: {e}", exc_info=True)
@@ -163,12 +331,14 @@ class VectorDB:
         Since ChromaDB's query() method does not support an 'offset' parameter,
         we fetch (offset + top_k) results and slice the list manually.
         """
-        query_embedding = self.model.encode([query_text]).tolist()
+        query_embedding = self.embed_query(query_text)
 
         fetch_count = offset + top_k
 
         results = self.collection.query(
-            query_embeddings=query_embedding, n_results=fetch_count
+            query_embeddings=query_embedding,
+            n_results=fetch_count,
+            include=["metadatas"],
         )
 
         if not results or not results.get("metadatas") or not results["metadatas"][0]:
@@ -204,7 +374,7 @@ class VectorDB:
         bm25_results = self.bm25_search(query_text, CANDIDATE_COUNT)
 
         # --- Dense vector layer ---
-        query_embedding = self.model.encode([query_text]).tolist()
+        query_embedding = self.embed_query(query_text)
         chroma_results = self.collection.query(
             query_embeddings=query_embedding,
             n_results=CANDIDATE_COUNT,
@@ -264,7 +434,8 @@ class VectorDB:
             return []
 
         pairs = [(query_text, meta.get("text_chunk", "")) for meta in candidates]
-        scores = self.cross_encoder.predict(pairs)
+        with torch.inference_mode():
+            scores = self.cross_encoder.predict(pairs)
 
         # Initial sort to identify top genres
         scored = sorted(zip(scores, candidates), key=lambda x: x[0], reverse=True)
@@ -361,7 +532,7 @@ class VectorDB:
         if not related_names:
             return []
 
-        query_embedding = self.model.encode([query_text]).tolist()
+        query_embedding = self.embed_query(query_text)
         try:
             results = self.collection.query(
                 query_embeddings=query_embedding,
@@ -380,41 +551,73 @@ class VectorDB:
 
         return [m for m in candidates if m.get("review_url") not in top_urls]
 
-    def add_batch(self, enriched_df: pd.DataFrame):
+    def start_encode_pool(self, workers: int):
+        """
+        Starts a SentenceTransformer multi-process pool for ingestion: one worker
+        per CUDA device if available, otherwise `workers` CPU processes.
+        """
+        if torch.cuda.is_available():
+            devices = [f"cuda:{i}" for i in range(torch.cuda.device_count())]
+        else:
+            devices = ["cpu"] * workers
+        logging.info(f"Starting embedding pool on {len(devices)} device(s): {devices}")
+        return self.model.start_multi_process_pool(target_devices=devices)
+
+    def stop_encode_pool(self, pool) -> None:
+        self.model.stop_multi_process_pool(pool)
+
+    def add_batch(self, enriched_df: pd.DataFrame, encode_pool=None):
         """
         Embeds and adds a batch of new documents to the database using a robust method.
+        If an encode pool is given, embedding of large batches is sharded across
+        its worker processes.
         """
         if enriched_df.empty:
             return 0
 
-        def _build_search_document(row) -> str:
-            parts = []
-            genres = row.get("artist_genres", "[]")
-            if isinstance(genres, str):
-                try:
-                    genres = json.loads(genres)
-                except (json.JSONDecodeError, TypeError):
-                    genres = []
-            if genres:
-                parts.append(f"Genres: {', '.join(genres)}.")
-            tags = row.get("tags", [])
-            if tags:
-                parts.append(f"Tags: {', '.join(tags)}.")
-            parts.append(f"Review excerpt: {row.get('text_chunk', '')}")
-            return " ".join(parts)
-
-        enriched_df["search_document"] = enriched_df.apply(_build_search_document, axis=1)
+        # Built column-wise: "Genres: ... . Tags: ... . Review excerpt: ...",
+        # omitting the genre/tag sections when empty.
+        genres = (
+            enriched_df["artist_genres"].map(parse_json_list)
+            if "artist_genres" in enriched_df
+            else pd.Series([[]] * len(enriched_df), index=enriched_df.index)
+        )
+        genres_part = genres.map(lambda g: f"Genres: {', '.join(g)}. " if g else "")
+        tags_part = enriched_df["tags"].map(lambda t: f"Tags: {', '.join(t)}. " if t else "")
+        enriched_df["search_document"] = (
+            genres_part + tags_part + "Review excerpt: " + enriched_df["text_chunk"]
+        )
 
+        # Encode every chunk in the batch with a single call; SentenceTransformer
+        # sorts by length internally, so large batches keep padding waste low.
         logging.info(f"Embedding {len(enriched_df)} new search documents...")
-        embeddings = self.model.encode(
-            enriched_df["search_document"].tolist(), show_progress_bar=True
-        )
+        # Small batches (e.g. the final flush) encode in-process: shipping a
+        # handful of documents through the pool's queues costs more than it saves.
+        if encode_pool is not None and len(enriched_df) >= config.EMBED_POOL_MIN_ROWS:
+            embeddings = self.model.encode_multi_process(
+                enriched_df["search_document"].tolist(),
+                encode_pool,
+                batch_size=self.embed_batch_size,
+            )
+        else:
+            with torch.inference_mode():
+                embeddings = self.model.encode(
+                    enriched_df["search_document"].tolist(),
+                    batch_size=self.embed_batch_size,
+                    convert_to_numpy=True,
+                    show_progress_bar=True,
+                )
+
+        # FP16 models on CUDA return float16; Chroma stores float32, so convert
+        # once here rather than per upsert slice.
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
 
         ids = [
-            hashlib.sha256(
-                f"{row.get('review_url', '')}{row.get('text_chunk', '')}".encode()
-            ).hexdigest()
-            for _, row in enriched_df.iterrows()
+            hashlib.sha256(f"{review_url}{text_chunk}".encode()).hexdigest()
+            for review_url, text_chunk in zip(
+                enriched_df.get("review_url", [""] * len(enriched_df)),
+                enriched_df.get("text_chunk", [""] * len(enriched_df)),
+            )
         ]
 
         # Deduplicate within the batch — identical review_url+text_chunk pairs
@@ -431,31 +634,44 @@ class VectorDB:
             logging.warning(f"Dropping {dupes} duplicate chunk(s) within batch before upsert.")
             enriched_df = enriched_df.iloc[unique_indices].reset_index(drop=True)
             ids = [ids[i] for i in unique_indices]
-
-        metadatas = []
-        for _, row in enriched_df.iterrows():
-            meta = row.to_dict()
-            meta.pop("search_document", None)
-            meta["tags"] = json.dumps(meta.get("tags", []))
-
-            for key, value in meta.items():
-                if value is None:
-                    meta[key] = "N/A"
-
-            metadatas.append(meta)
-
-        batch_size = 100
+            embeddings = embeddings[unique_indices]
+
+        meta_df = enriched_df.drop(columns=["search_document"])
+        tags = meta_df["tags"] if "tags" in meta_df else [[]] * len(meta_df)
+        meta_df["tags"] = [orjson.dumps(t).decode() for t in tags]
+        metadatas = meta_df.fillna("N/A").to_dict(orient="records")
+
+        # Materialise the documents column once and hand Chroma numpy slices
+        # directly — it accepts ndarrays, so there is no need to box every
+        # float into a Python list per sub-batch.
+        documents = enriched_df["search_document"].tolist()
+        # One upsert per flush where possible; only split when the batch
+        # exceeds the server's advertised maximum.
+        count_before = self.get_count()
+        batch_size = self.max_batch_size
+        all_upserted = True
         for i in range(0, len(enriched_df), batch_size):
             try:
                 self.collection.upsert(
                     ids=ids[i : i + batch_size],
-                    embeddings=embeddings[i : i + batch_size].tolist(),
+                    embeddings=embeddings[i : i + batch_size],
                     metadatas=metadatas[i : i + batch_size],
-                    documents=enriched_df["search_document"].tolist()[
-                        i : i + batch_size
-                    ],
+                    documents=documents[i : i + batch_size],
                 )
             except Exception as e:
+                all_upserted = False
                 logging.error(f"Error upserting batch {i} to ChromaDB: {e}")
 
+        # Keep the sidecar URL index in step with the collection. After a
+        # partial failure it is left stale, so the next run falls back to a scan.
+        if all_upserted:
+            try:
+                self._save_url_index(
+                    enriched_df["review_url"].unique(),
+                    self.get_count(),
+                    previous_count=count_before,
+                )
+            except sqlite3.Error as e:
+                logging.warning(f"Could not update processed URL index: {e}")
+
         return len(enriched_df)
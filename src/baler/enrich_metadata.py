@@ -22,7 +22,7 @@ import chromadb
 
 from . import config
 from .music_services import LastFmClient
-from .utils import parse_json_list
+from .utils import parse_json_list, run_async
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logging.getLogger("chromadb").setLevel(logging.WARNING)
@@ -39,9 +39,11 @@ def get_chroma_collection():
             tenant=config.CHROMA_CLOUD_TENANT,
             database=config.CHROMA_CLOUD_DATABASE,
         )
-    else:
-        client = chromadb.HttpClient(host=config.CHROMA_HOST, port=config.CHROMA_PORT)
-    return client.get_or_create_collection(name=config.COLLECTION_NAME)
+        return client.get_or_create_collection(name=config.COLLECTION_NAME)
+    client = chromadb.HttpClient(host=config.CHROMA_HOST, port=config.CHROMA_PORT)
+    return client.get_or_create_collection(
+        name=config.COLLECTION_NAME, metadata=config.COLLECTION_METADATA
+    )
 
 
 def build_search_document(meta: dict, lastfm_data: dict) -> str:
@@ -123,6 +125,15 @@ async def enrich_album(collection, lastfm: LastFmClient, review_url: str, album_
 async def run_enrichment():
     collection = get_chroma_collection()
     lastfm = LastFmClient()
+    try:
+        await _enrich_collection(collection, lastfm)
+    finally:
+        # Release the pooled Last.fm connections on every exit path.
+        await lastfm.aclose()
+
+
+async def _enrich_collection(collection, lastfm: LastFmClient):
+    """Scans the collection in batches and enriches each album not yet seen this run."""
     loop = asyncio.get_running_loop()
     semaphore = asyncio.Semaphore(CONCURRENCY)
 
@@ -188,4 +199,4 @@ async def run_enrichment():
 
 
 if __name__ == "__main__":
-    asyncio.run(run_enrichment())
+    run_async(run_enrichment())
@@ -1,10 +1,12 @@
+import asyncio
 import json
-import re
+import time
 from collections.abc import AsyncGenerator
 
 import google.auth
 import google.auth.transport.requests
 import httpx
+import orjson
 
 from . import config
 from .utils import parse_json_list
@@ -33,6 +35,17 @@ TAG_PROMPT = (
     "Review excerpt: {chunk}"
 )
 
+BATCH_TAG_PROMPT = (
+    "Generate 5-8 descriptive tags for each of the following {count} numbered excerpts "
+    "from the same music review. "
+    "{genre_context}"
+    "Focus on mood/atmosphere, production style, instrumentation, and sonic characteristics. "
+    "Return ONLY a valid JSON array with exactly {count} elements, where element i is a JSON "
+    "array of lowercase tag strings for excerpt i. "
+    'Example for 2 excerpts: [["melancholic", "lo-fi", "tape-saturated"], ["driving", "guitar-driven", "claustrophobic"]]\n\n'
+    "{excerpts}"
+)
+
 _TAG_GENRE_CONTEXT = "The artist's genres are already known ({genres}), so avoid simply repeating them — "
 _TAG_NO_GENRE_CONTEXT = "Tags should cover genre, subgenre, mood/atmosphere, production style, and instrumentation. "
 
@@ -71,30 +84,164 @@ def _format_context_entry(c: dict) -> str:
 
 
 def _format_sources(context_chunks: list[dict]) -> list[dict]:
-    """Build the unique sources list from context chunks for the NDJSON stream."""
-    sources = [
-        {
-            "album_title": c["album_title"],
-            "artist": c["artist"],
-            "url": c["review_url"],
-            "album_cover_url": c.get("album_cover_url", "N/A"),
-            "score": c.get("score", "N/A"),
-        }
-        for c in context_chunks
-    ]
-    return [dict(t) for t in {tuple(d.items()) for d in sources}]
+    """
+    Build the unique sources list from context chunks for the NDJSON stream.
+    Deduplicates by review URL, keeping the first (highest-ranked) chunk.
+    """
+    sources: dict[str, dict] = {}
+    for c in context_chunks:
+        if c["review_url"] not in sources:
+            sources[c["review_url"]] = {
+                "album_title": c["album_title"],
+                "artist": c["artist"],
+                "url": c["review_url"],
+                "album_cover_url": c.get("album_cover_url", "N/A"),
+                "score": c.get("score", "N/A"),
+            }
+    return list(sources.values())
+
+
+def _ndjson(event: dict) -> bytes:
+    """Serializes one event of the /recommend NDJSON stream."""
+    return orjson.dumps(event) + b"\n"
+
+
+def _ndjson_chunk(text: str) -> bytes:
+    """
+    Serializes a {chunk} event. Only the token text is encoded; the fixed
+    envelope is spliced around it, avoiding a dict per streamed token.
+    """
+    return b'{"chunk":' + orjson.dumps(text) + b'}\n'
+
+
+_JSON_DECODER = json.JSONDecoder()
+
+
+def _extract_json(text: str, opener: str):
+    """
+    Decodes the first JSON value starting at `opener` ('[' or '{') in an LLM
+    response, ignoring any prose or code fences around it. raw_decode stops at
+    the matching close bracket, so nesting and brackets inside strings are
+    handled in one pass. Returns None if nothing parses.
+    """
+    start = text.find(opener)
+    if start == -1:
+        return None
+    try:
+        value, _ = _JSON_DECODER.raw_decode(text, start)
+    except json.JSONDecodeError:
+        return None
+    return value
 
 
 def _parse_tags(text: str) -> list[str]:
     """Extract a JSON array of tags from an LLM response, tolerating prose wrapping."""
-    match = re.search(r"\[.*?\]", text, re.DOTALL)
-    if not match:
+    tags = _extract_json(text, "[")
+    if not isinstance(tags, list):
         return []
+    return [t.lower().strip() for t in tags if isinstance(t, str)]
+
+
+def _build_batch_tag_prompt(chunks: list[str], genres: list[str] | None) -> str:
+    genre_context = _TAG_GENRE_CONTEXT.format(genres=", ".join(genres)) if genres else _TAG_NO_GENRE_CONTEXT
+    excerpts = "\n\n".join(f"Excerpt {i}: {chunk}" for i, chunk in enumerate(chunks, 1))
+    return BATCH_TAG_PROMPT.format(count=len(chunks), genre_context=genre_context, excerpts=excerpts)
+
+
+def _parse_tag_batch(text: str, count: int) -> list[list[str]] | None:
+    """
+    Extract a JSON array of per-excerpt tag arrays from an LLM response.
+    Returns None if the response can't be parsed or has the wrong length.
+    """
+    batch = _extract_json(text, "[")
+    if not isinstance(batch, list) or len(batch) != count:
+        return None
+    return [
+        [t.lower().strip() for t in tags if isinstance(t, str)] if isinstance(tags, list) else []
+        for tags in batch
+    ]
+
+
+async def _tag_chunks_individually(llm, client: httpx.AsyncClient, chunks: list[str], genres: list[str] | None) -> list[list[str]]:
+    """
+    Fallback for a batch reply that was malformed or had the wrong number of
+    entries: one tag request per chunk. Not used when the request itself
+    failed, since repeating it per chunk would only multiply the failure.
+    """
+    return list(await asyncio.gather(*(llm.generate_tags_for_chunk(client, c, genres=genres) for c in chunks)))
+
+
+class _AIMDLimiter:
+    """
+    Caps in-flight tag requests with additive-increase/multiplicative-decrease:
+    the limit halves whenever the API throttles and grows by one after a full
+    window of successes, so bulk tagging settles just under the provider quota.
+    """
+
+    def __init__(self, max_limit: int):
+        self.max_limit = max_limit
+        self.limit = float(max_limit)
+        self._in_flight = 0
+        self._successes = 0
+        self._last_cut = 0.0
+        self._cond = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._in_flight < int(self.limit))
+            self._in_flight += 1
+
+    async def __aexit__(self, *exc_info):
+        async with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self):
+        self._successes += 1
+        if self._successes >= self.limit:
+            self._successes = 0
+            self.limit = min(self.limit + 1, self.max_limit)
+
+    def on_throttle(self):
+        # Requests already in flight when the quota is hit tend to fail together;
+        # count that burst as a single congestion signal.
+        now = time.monotonic()
+        if now - self._last_cut < 1.0:
+            return
+        self._last_cut = now
+        self._successes = 0
+        self.limit = max(1.0, self.limit / 2)
+
+
+def _retry_delay(response: httpx.Response, attempt: int) -> float:
+    """Seconds to wait before retrying a throttled request: Retry-After if given, else 2^attempt."""
     try:
-        tags = json.loads(match.group())
-        return [t.lower().strip() for t in tags if isinstance(t, str)]
-    except json.JSONDecodeError:
-        return []
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return float(2 ** attempt)
+
+
+async def _post_throttled(
+    limiter: _AIMDLimiter, client: httpx.AsyncClient, url: str, payload: dict, headers: dict, timeout: float
+) -> httpx.Response:
+    """
+    POSTs a tag request under the client's AIMD limiter, backing off and
+    retrying on 429/503 up to TAG_MAX_RETRIES times. Raises on any other error.
+    The payload is encoded once with orjson and reused across retries.
+    """
+    content = orjson.dumps(payload)
+    headers = {**headers, "Content-Type": "application/json"}
+    for attempt in range(config.TAG_MAX_RETRIES + 1):
+        async with limiter:
+            response = await client.post(url, content=content, headers=headers, timeout=timeout)
+        if response.status_code not in (429, 503):
+            response.raise_for_status()
+            limiter.on_success()
+            return response
+        limiter.on_throttle()
+        if attempt < config.TAG_MAX_RETRIES:
+            await asyncio.sleep(_retry_delay(response, attempt))
+    response.raise_for_status()
 
 
 # --- CLIENT FACTORY ---
@@ -116,13 +263,29 @@ def get_llm_client(provider: str = None):
 
 # --- SHARED AUTH HELPER ---
 
-def _get_google_credentials():
-    credentials, _ = google.auth.default(
-        scopes=["https://www.googleapis.com/auth/cloud-platform"]
-    )
-    auth_req = google.auth.transport.requests.Request()
-    credentials.refresh(auth_req)
-    return {"Authorization": f"Bearer {credentials.token}"}
+class _GoogleAuth:
+    """
+    Holds Google credentials and the Authorization header for the current
+    token. The token is refreshed, and the header rebuilt, only when it has
+    expired or is about to (google-auth's `valid` includes a refresh margin).
+    The blocking refresh runs in a worker thread, and concurrent callers share
+    a single refresh rather than each starting one.
+    """
+
+    def __init__(self, scopes: list[str]):
+        self.credentials, _ = google.auth.default(scopes=scopes)
+        self._request = google.auth.transport.requests.Request()
+        self._headers = None
+        self._refresh_lock = asyncio.Lock()
+
+    async def headers(self) -> dict:
+        if self._headers is not None and self.credentials.valid:
+            return self._headers
+        async with self._refresh_lock:
+            if self._headers is None or not self.credentials.valid:
+                await asyncio.to_thread(self.credentials.refresh, self._request)
+                self._headers = {"Authorization": f"Bearer {self.credentials.token}"}
+        return self._headers
 
 
 # --- CLIENTS ---
@@ -133,6 +296,11 @@ class OllamaClient:
     def __init__(self):
         self.api_url = config.OLLAMA_API_URL
         self.model = config.OLLAMA_MODEL
+        # Shared across requests so keep-alive connections are reused.
+        self.http_client = httpx.AsyncClient()
+
+    async def aclose(self):
+        await self.http_client.aclose()
 
     async def generate_tags_for_chunk(self, client: httpx.AsyncClient, chunk: str, genres: list[str] | None = None) -> list[str]:
         """Generates semantic tags for a review chunk using Ollama."""
@@ -142,39 +310,56 @@ class OllamaClient:
         try:
             response = await client.post(self.api_url, json=payload, timeout=60.0)
             response.raise_for_status()
-            text = response.json().get("response", "")
+            text = orjson.loads(response.content).get("response", "")
             return _parse_tags(text)
         except Exception:
             return []
 
+    async def generate_tags_for_chunks(self, client: httpx.AsyncClient, chunks: list[str], genres: list[str] | None = None) -> list[list[str]]:
+        """Generates tags for several chunks of one review in a single Ollama call."""
+        prompt = _build_batch_tag_prompt(chunks, genres)
+        payload = {"model": self.model, "prompt": prompt, "stream": False}
+        try:
+            response = await client.post(self.api_url, json=payload, timeout=120.0)
+            response.raise_for_status()
+        except Exception:
+            # Untagged chunks are skipped and retried on the next run.
+            return [[] for _ in chunks]
+        try:
+            batch = _parse_tag_batch(orjson.loads(response.content).get("response", ""), len(chunks))
+        except Exception:
+            batch = None
+        if batch is None:
+            return await _tag_chunks_individually(self, client, chunks, genres)
+        return batch
+
     async def extract_filters(self, query: str) -> dict:
         """Ollama stub — filter extraction not supported, returns no filters."""
         return {**_FILTER_DEFAULTS, "clean_query": query}
 
     async def stream_response(
         self, query_text: str, context_chunks: list[dict]
-    ) -> AsyncGenerator[str, None]:
+    ) -> AsyncGenerator[bytes, None]:
         """Streams a chat response from Ollama based on the query and context."""
         context_str = "\n\n".join(_format_context_entry(c) for c in context_chunks)
         full_prompt = f"CONTEXT FROM REVIEWS:\n{context_str}\n\nUSER'S QUERY: '{query_text}'"
         payload = {"model": self.model, "system": SYSTEM_PROMPT, "prompt": full_prompt, "stream": True}
 
         try:
-            async with httpx.AsyncClient() as client:
-                async with client.stream("POST", self.api_url, json=payload, timeout=300.0) as response:
-                    response.raise_for_status()
-                    async for line in response.aiter_lines():
-                        if line:
-                            data = json.loads(line)
-                            if not data.get("done"):
-                                yield json.dumps({"chunk": data.get("response", "")}) + "\n"
+            async with self.http_client.stream("POST", self.api_url, json=payload, timeout=300.0) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if line:
+                        data = orjson.loads(line)
+                        if not data.get("done"):
+                            yield _ndjson_chunk(data.get("response", ""))
 
-            yield json.dumps({"sources": _format_sources(context_chunks)}) + "\n"
+            yield _ndjson({"sources": _format_sources(context_chunks)})
 
         except httpx.RequestError as e:
-            yield json.dumps({"error": f"Could not connect to Ollama. Please ensure it's running. Details: {e!r}"}) + "\n"
+            yield _ndjson({"error": f"Could not connect to Ollama. Please ensure it's running. Details: {e!r}"})
         except Exception as e:
-            yield json.dumps({"error": f"An error occurred streaming from Ollama: {e}"}) + "\n"
+            yield _ndjson({"error": f"An error occurred streaming from Ollama: {e}"})
 
 
 class GeminiClient:
@@ -182,17 +367,21 @@ class GeminiClient:
 
     def __init__(self):
         self.api_url_base = f"https://generativelanguage.googleapis.com/v1beta/models/{config.GEMINI_MODEL}"
-        self.credentials, _ = google.auth.default(
+        self.auth = _GoogleAuth(
             scopes=[
                 "https://www.googleapis.com/auth/cloud-platform",
                 "https://www.googleapis.com/auth/generative-language",
             ]
         )
+        # Shared across requests so the TLS connection to Gemini is reused.
+        self.http_client = httpx.AsyncClient()
+        self.tag_limiter = _AIMDLimiter(config.KB_CONCURRENCY_LIMIT)
+
+    async def aclose(self):
+        await self.http_client.aclose()
 
-    def _get_auth_headers(self) -> dict:
-        auth_req = google.auth.transport.requests.Request()
-        self.credentials.refresh(auth_req)
-        return {"Authorization": f"Bearer {self.credentials.token}"}
+    async def _get_auth_headers(self) -> dict:
+        return await self.auth.headers()
 
     async def generate_tags_for_chunk(self, client: httpx.AsyncClient, chunk: str, genres: list[str] | None = None) -> list[str]:
         """Generates semantic tags for a review chunk using Gemini."""
@@ -201,14 +390,37 @@ class GeminiClient:
         api_url = f"{self.api_url_base}:generateContent"
         payload = {"contents": [{"parts": [{"text": prompt}]}]}
         try:
-            headers = self._get_auth_headers()
-            response = await client.post(api_url, json=payload, headers=headers, timeout=30.0)
-            response.raise_for_status()
-            text = response.json()["candidates"][0]["content"]["parts"][0]["text"]
+            headers = await self._get_auth_headers()
+            response = await _post_throttled(self.tag_limiter, client, api_url, payload, headers, timeout=30.0)
+            text = orjson.loads(response.content)["candidates"][0]["content"]["parts"][0]["text"]
             return _parse_tags(text)
         except Exception:
             return []
 
+    async def generate_tags_for_chunks(self, client: httpx.AsyncClient, chunks: list[str], genres: list[str] | None = None) -> list[list[str]]:
+        """Generates tags for several chunks of one review in a single Gemini call."""
+        prompt = _build_batch_tag_prompt(chunks, genres)
+        api_url = f"{self.api_url_base}:generateContent"
+        payload = {
+            "contents": [{"parts": [{"text": prompt}]}],
+            "generationConfig": {"responseMimeType": "application/json"},
+        }
+        try:
+            headers = await self._get_auth_headers()
+            response = await _post_throttled(self.tag_limiter, client, api_url, payload, headers, timeout=60.0)
+        except Exception:
+            # Includes 429/503 after TAG_MAX_RETRIES: fanning out per chunk would
+            # only add load to a throttled endpoint. Untagged chunks are retried next run.
+            return [[] for _ in chunks]
+        try:
+            text = orjson.loads(response.content)["candidates"][0]["content"]["parts"][0]["text"]
+            batch = _parse_tag_batch(text, len(chunks))
+        except Exception:
+            batch = None
+        if batch is None:
+            return await _tag_chunks_individually(self, client, chunks, genres)
+        return batch
+
     async def extract_filters(self, query: str) -> dict:
         """Parses exclusion filters from a user query using a fast Gemini call."""
         default = {**_FILTER_DEFAULTS, "clean_query": query}
@@ -216,22 +428,20 @@ class GeminiClient:
         api_url = f"{self.api_url_base}:generateContent"
         payload = {"contents": [{"parts": [{"text": prompt}]}]}
         try:
-            async with httpx.AsyncClient() as client:
-                headers = self._get_auth_headers()
-                response = await client.post(api_url, json=payload, headers=headers, timeout=10.0)
-                response.raise_for_status()
-                text = response.json()["candidates"][0]["content"]["parts"][0]["text"]
-            match = re.search(r"\{.*\}", text, re.DOTALL)
-            if not match:
+            headers = await self._get_auth_headers()
+            response = await self.http_client.post(api_url, json=payload, headers=headers, timeout=10.0)
+            response.raise_for_status()
+            text = orjson.loads(response.content)["candidates"][0]["content"]["parts"][0]["text"]
+            parsed = _extract_json(text, "{")
+            if not isinstance(parsed, dict):
                 return default
-            parsed = json.loads(match.group())
             return {**default, **parsed}
         except Exception:
             return default
 
     async def stream_response(
         self, query_text: str, context_chunks: list[dict]
-    ) -> AsyncGenerator[str, None]:
+    ) -> AsyncGenerator[bytes, None]:
         """Streams a chat response from Gemini based on the query and context."""
         context_str = "\n\n".join(_format_context_entry(c) for c in context_chunks)
         full_prompt = f"{SYSTEM_PROMPT}\n\nCONTEXT FROM REVIEWS:\n{context_str}\n\nUSER'S QUERY: '{query_text}'"
@@ -240,27 +450,31 @@ class GeminiClient:
         payload = {"contents": [{"parts": [{"text": full_prompt}]}]}
 
         try:
-            headers = self._get_auth_headers()
-            async with httpx.AsyncClient() as client:
-                async with client.stream("POST", api_url, json=payload, headers=headers, timeout=60.0) as response:
-                    if response.status_code != 200:
-                        error_content = await response.aread()
-                        yield json.dumps({"error": f"Gemini API Error {response.status_code}: {error_content.decode()}"}) + "\n"
-                        return
-
-                    async for line in response.aiter_lines():
-                        if line.startswith("data:"):
-                            try:
-                                data = json.loads(line[len("data:"):].strip())
-                                if "candidates" in data and data["candidates"]:
-                                    yield json.dumps({"chunk": data["candidates"][0]["content"]["parts"][0]["text"]}) + "\n"
-                            except Exception as e:
-                                yield json.dumps({"error": f"Error processing stream: {e}"}) + "\n"
-
-            yield json.dumps({"sources": _format_sources(context_chunks)}) + "\n"
+            headers = await self._get_auth_headers()
+            async with self.http_client.stream("POST", api_url, json=payload, headers=headers, timeout=60.0) as response:
+                if response.status_code != 200:
+                    error_content = await response.aread()
+                    yield _ndjson({"error": f"Gemini API Error {response.status_code}: {error_content.decode()}"})
+                    return
+
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    try:
+                        data = orjson.loads(line[5:])
+                    except orjson.JSONDecodeError as e:
+                        yield _ndjson({"error": f"Error processing stream: {e}"})
+                        continue
+                    try:
+                        text = data["candidates"][0]["content"]["parts"][0]["text"]
+                    except (KeyError, IndexError, TypeError):
+                        continue  # no text in this event, e.g. a bare finishReason
+                    yield _ndjson_chunk(text)
+
+            yield _ndjson({"sources": _format_sources(context_chunks)})
 
         except Exception as e:
-            yield json.dumps({"error": f"An error occurred streaming: {e}"}) + "\n"
+            yield _ndjson({"error": f"An error occurred streaming: {e}"})
 
 
 class VertexClient:
@@ -277,9 +491,15 @@ class VertexClient:
             f"https://{region}-aiplatform.googleapis.com/v1/projects/{project}"
             f"/locations/{region}/publishers/google/models/{model}"
         )
+        self.auth = _GoogleAuth(scopes=["https://www.googleapis.com/auth/cloud-platform"])
+        self.http_client = httpx.AsyncClient()
+        self.tag_limiter = _AIMDLimiter(config.KB_CONCURRENCY_LIMIT)
 
-    def _get_auth_headers(self) -> dict:
-        return _get_google_credentials()
+    async def aclose(self):
+        await self.http_client.aclose()
+
+    async def _get_auth_headers(self) -> dict:
+        return await self.auth.headers()
 
     async def generate_tags_for_chunk(self, client: httpx.AsyncClient, chunk: str, genres: list[str] | None = None) -> list[str]:
         """Generates semantic tags for a review chunk using Vertex AI."""
@@ -288,21 +508,44 @@ class VertexClient:
         api_url = f"{self.api_url_base}:generateContent"
         payload = {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
         try:
-            headers = self._get_auth_headers()
-            response = await client.post(api_url, json=payload, headers=headers, timeout=30.0)
-            response.raise_for_status()
-            text = response.json()["candidates"][0]["content"]["parts"][0]["text"]
+            headers = await self._get_auth_headers()
+            response = await _post_throttled(self.tag_limiter, client, api_url, payload, headers, timeout=30.0)
+            text = orjson.loads(response.content)["candidates"][0]["content"]["parts"][0]["text"]
             return _parse_tags(text)
         except Exception:
             return []
 
+    async def generate_tags_for_chunks(self, client: httpx.AsyncClient, chunks: list[str], genres: list[str] | None = None) -> list[list[str]]:
+        """Generates tags for several chunks of one review in a single Vertex AI call."""
+        prompt = _build_batch_tag_prompt(chunks, genres)
+        api_url = f"{self.api_url_base}:generateContent"
+        payload = {
+            "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+            "generationConfig": {"responseMimeType": "application/json"},
+        }
+        try:
+            headers = await self._get_auth_headers()
+            response = await _post_throttled(self.tag_limiter, client, api_url, payload, headers, timeout=60.0)
+        except Exception:
+            # Includes 429/503 after TAG_MAX_RETRIES: fanning out per chunk would
+            # only add load to a throttled endpoint. Untagged chunks are retried next run.
+            return [[] for _ in chunks]
+        try:
+            text = orjson.loads(response.content)["candidates"][0]["content"]["parts"][0]["text"]
+            batch = _parse_tag_batch(text, len(chunks))
+        except Exception:
+            batch = None
+        if batch is None:
+            return await _tag_chunks_individually(self, client, chunks, genres)
+        return batch
+
     async def extract_filters(self, query: str) -> dict:
         """Vertex stub — filter extraction not used in production (app uses GeminiClient)."""
         return {**_FILTER_DEFAULTS, "clean_query": query}
 
     async def stream_response(
         self, query_text: str, context_chunks: list[dict]
-    ) -> AsyncGenerator[str, None]:
+    ) -> AsyncGenerator[bytes, None]:
         """Streams a chat response from Vertex AI (for local testing with VERTEX provider)."""
         context_str = "\n\n".join(_format_context_entry(c) for c in context_chunks)
         full_prompt = f"{SYSTEM_PROMPT}\n\nCONTEXT FROM REVIEWS:\n{context_str}\n\nUSER'S QUERY: '{query_text}'"
@@ -311,24 +554,28 @@ class VertexClient:
         payload = {"contents": [{"role": "user", "parts": [{"text": full_prompt}]}]}
 
         try:
-            headers = self._get_auth_headers()
-            async with httpx.AsyncClient() as client:
-                async with client.stream("POST", api_url, json=payload, headers=headers, timeout=60.0) as response:
-                    if response.status_code != 200:
-                        error_content = await response.aread()
-                        yield json.dumps({"error": f"Vertex API Error {response.status_code}: {error_content.decode()}"}) + "\n"
-                        return
-
-                    async for line in response.aiter_lines():
-                        if line.startswith("data:"):
-                            try:
-                                data = json.loads(line[len("data:"):].strip())
-                                if "candidates" in data and data["candidates"]:
-                                    yield json.dumps({"chunk": data["candidates"][0]["content"]["parts"][0]["text"]}) + "\n"
-                            except Exception as e:
-                                yield json.dumps({"error": f"Error processing stream: {e}"}) + "\n"
-
-            yield json.dumps({"sources": _format_sources(context_chunks)}) + "\n"
+            headers = await self._get_auth_headers()
+            async with self.http_client.stream("POST", api_url, json=payload, headers=headers, timeout=60.0) as response:
+                if response.status_code != 200:
+                    error_content = await response.aread()
+                    yield _ndjson({"error": f"Vertex API Error {response.status_code}: {error_content.decode()}"})
+                    return
+
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    try:
+                        data = orjson.loads(line[5:])
+                    except orjson.JSONDecodeError as e:
+                        yield _ndjson({"error": f"Error processing stream: {e}"})
+                        continue
+                    try:
+                        text = data["candidates"][0]["content"]["parts"][0]["text"]
+                    except (KeyError, IndexError, TypeError):
+                        continue  # no text in this event, e.g. a bare finishReason
+                    yield _ndjson_chunk(text)
+
+            yield _ndjson({"sources": _format_sources(context_chunks)})
 
         except Exception as e:
-            yield json.dumps({"error": f"An error occurred streaming: {e}"}) + "\n"
+            yield _ndjson({"error": f"An error occurred streaming: {e}"})
@@ -1,9 +1,16 @@
+import asyncio
+import hashlib
 import json
 import logging
+import queue
 import re
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from datetime import UTC, datetime
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
 
+import orjson
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
@@ -23,14 +30,19 @@ query_logger.setLevel(logging.INFO)
 # 1. Console Handler (For Cloud/Docker logs)
 console_handler = logging.StreamHandler()
 console_handler.setFormatter(logging.Formatter("%(message)s"))
-query_logger.addHandler(console_handler)
 
 # 2. File Handler (For local persistent storage)
 # We use the project root to store the log file
 log_file_path = config.LOG_DIR / "user_queries.log"
 file_handler = logging.FileHandler(log_file_path)
 file_handler.setFormatter(logging.Formatter("%(message)s"))
-query_logger.addHandler(file_handler)
+
+# Requests only enqueue the record; a background thread does the stream and
+# file writes, so a slow log sink never blocks the event loop.
+query_log_queue = queue.SimpleQueue()
+query_logger.addHandler(QueueHandler(query_log_queue))
+query_log_listener = QueueListener(query_log_queue, console_handler, file_handler)
+query_log_listener.start()
 
 # --- INITIALIZATION ---
 try:
@@ -41,9 +53,25 @@ except Exception as e:
     logging.critical(f"Failed to initialize services: {e}")
     exit(1)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pay the first-inference setup cost at startup rather than on the first request.
+    try:
+        await asyncio.to_thread(db.warm_up)
+    except Exception as e:
+        logging.warning(f"Model warm-up failed: {e}")
+    yield
+    # Close the pooled HTTP connections on shutdown.
+    await llm.aclose()
+    await spotify.aclose()
+    query_log_listener.stop()
+
+
 app = FastAPI(
     title="Baler Music Recommendation API",
     description="A chatbot for nuanced music recommendations from Pitchfork reviews.",
+    lifespan=lifespan,
 )
 
 # --- MIDDLEWARE ---
@@ -93,6 +121,61 @@ class AlbumQuery(BaseModel):
     artist: str
 
 
+# Tell reverse proxies (nginx honours X-Accel-Buffering) and caches not to hold
+# the NDJSON stream back, so each token reaches the browser as it is generated.
+_STREAM_HEADERS = {"X-Accel-Buffering": "no", "Cache-Control": "no-cache"}
+
+# --- RESPONSE CACHE ---
+# Completed LLM streams keyed by the exact query text and the full metadata of each
+# context chunk (excerpt, genres, related artists, source fields), i.e. everything
+# the prompt and {sources} event are built from. A repeated question over the same
+# excerpts replays instead of re-generating.
+_response_cache: OrderedDict[bytes, bytes] = OrderedDict()
+
+
+def _response_cache_key(query_text: str, context: list[dict]) -> bytes:
+    h = hashlib.blake2b(query_text.encode(), digest_size=16)
+    for c in context:
+        # The same review can surface with a different winning chunk (e.g. vector-only
+        # search before the BM25 index is ready), so the URL alone is not enough.
+        h.update(b"\0" + orjson.dumps(c, option=orjson.OPT_SORT_KEYS))
+    return h.digest()
+
+
+def _cache_response(key: bytes, body: bytes):
+    _response_cache[key] = body
+    _response_cache.move_to_end(key)
+    if len(_response_cache) > config.RESPONSE_CACHE_SIZE:
+        _response_cache.popitem(last=False)
+
+
+# --- RETRIEVAL ---
+# Admission control for the CPU-bound part of /recommend: each retrieval already
+# uses all of torch's intra-op threads, so running more at once only adds
+# contention. Excess requests wait here instead of oversubscribing the cores.
+_retrieval_slots = asyncio.Semaphore(config.RETRIEVAL_CONCURRENCY)
+
+
+def _retrieve(search_query: str, filters: dict) -> list[dict]:
+    """Runs the blocking retrieval pipeline for one query and returns ranked matches."""
+    # Hybrid retrieval: BM25 + vector search fused via RRF, then cross-encoder rerank
+    candidates = db.hybrid_search(search_query, top_k=50)
+    candidates = db.apply_exclusion_filters(candidates, filters)
+    unique_matches = db.rerank(search_query, candidates)
+
+    # Expand candidate pool with albums by related artists of top results
+    expanded = db.expand_with_related_artists(search_query, unique_matches[:5])
+    if expanded:
+        expanded = db.apply_exclusion_filters(expanded, filters)
+        expanded_reranked = db.rerank(search_query, expanded)
+        existing_urls = {m.get("review_url") for m in unique_matches}
+        for m in expanded_reranked:
+            if m.get("review_url") not in existing_urls:
+                unique_matches.append(m)
+                existing_urls.add(m.get("review_url"))
+    return unique_matches
+
+
 # --- API ENDPOINTS ---
 
 
@@ -123,21 +206,10 @@ async def get_recommendation_stream(query: Query, request: Request):
         filters = {"exclude_genres": [], "exclude_artists": [], "max_year": None, "min_year": None}
         search_query = query.text
 
-    # Hybrid retrieval: BM25 + vector search fused via RRF, then cross-encoder rerank
-    candidates = db.hybrid_search(search_query, top_k=50)
-    candidates = db.apply_exclusion_filters(candidates, filters)
-    unique_matches = db.rerank(search_query, candidates)
-
-    # Expand candidate pool with albums by related artists of top results
-    expanded = db.expand_with_related_artists(search_query, unique_matches[:5])
-    if expanded:
-        expanded = db.apply_exclusion_filters(expanded, filters)
-        expanded_reranked = db.rerank(search_query, expanded)
-        existing_urls = {m.get("review_url") for m in unique_matches}
-        for m in expanded_reranked:
-            if m.get("review_url") not in existing_urls:
-                unique_matches.append(m)
-                existing_urls.add(m.get("review_url"))
+    # Embedding, Chroma queries and reranking are blocking; run them off the
+    # event loop so concurrent requests keep streaming meanwhile.
+    async with _retrieval_slots:
+        unique_matches = await asyncio.to_thread(_retrieve, search_query, filters)
 
     # Filter out albums by artists the user explicitly mentioned — they want novel discoveries
     query_lower = query.text.lower()
@@ -157,16 +229,16 @@ async def get_recommendation_stream(query: Query, request: Request):
 
         async def empty_stream():
             yield (
-                json.dumps(
+                orjson.dumps(
                     {
                         "chunk": "Apologies, but my knowledge base is currently empty. Please run the data ingestion script to populate the database."
                     }
                 )
-                + "\n"
+                + b"\n"
             )
-            yield json.dumps({"sources": []}) + "\n"
+            yield orjson.dumps({"sources": []}) + b"\n"
 
-        return StreamingResponse(empty_stream(), media_type="application/x-ndjson")
+        return StreamingResponse(empty_stream(), media_type="application/x-ndjson", headers=_STREAM_HEADERS)
 
     # The first top_k are for the LLM context
     context = unique_matches[: query.top_k]
@@ -189,15 +261,34 @@ async def get_recommendation_stream(query: Query, request: Request):
     # We need to inject the remaining matches into the stream.
     # We'll do this by modifying the generator to yield them at the end.
 
+    cache_key = _response_cache_key(query.text, context)
+
     async def stream_with_extras():
-        # 1. Stream the LLM response as normal
-        async for chunk in llm.stream_response(query.text, context):
-            yield chunk
+        # 1. Replay a cached LLM response, or stream it and cache it if it
+        # produced answer text and no error event. A reply with no text (e.g.
+        # safety-blocked, only {sources}) is not cached, so it gets regenerated.
+        cached = _response_cache.get(cache_key)
+        if cached is not None:
+            _response_cache.move_to_end(cache_key)
+            yield cached
+        else:
+            parts = []
+            failed = False
+            has_text = False
+            async for chunk in llm.stream_response(query.text, context):
+                parts.append(chunk)
+                failed = failed or chunk.startswith(b'{"error"')
+                has_text = has_text or (
+                    chunk.startswith(b'{"chunk"') and chunk != b'{"chunk":""}\n'
+                )
+                yield chunk
+            if has_text and not failed:
+                _cache_response(cache_key, b"".join(parts))
 
         # 2. After the LLM is done, yield the remaining matches as a special event
-        yield json.dumps({"remaining_sources": formatted_remaining}) + "\n"
+        yield orjson.dumps({"remaining_sources": formatted_remaining}) + b"\n"
 
-    return StreamingResponse(stream_with_extras(), media_type="application/x-ndjson")
+    return StreamingResponse(stream_with_extras(), media_type="application/x-ndjson", headers=_STREAM_HEADERS)
 
 
 @app.post("/find-album-url")
@@ -19,6 +19,12 @@ class LastFmClient:
 
     def __init__(self):
         self.api_key = config.LASTFM_API_KEY
+        # Shared across lookups so the three parallel calls per album reuse
+        # keep-alive connections instead of a fresh TLS handshake each time.
+        self.http_client = httpx.AsyncClient(timeout=15)
+
+    async def aclose(self):
+        await self.http_client.aclose()
 
     async def get_metadata(self, artist: str, album: str) -> dict:
         """
@@ -27,33 +33,33 @@ class LastFmClient:
         Uses album tags if available, falls back to artist tags.
         Never raises — returns empty lists on failure.
         """
-        async with httpx.AsyncClient(timeout=15) as client:
-            album_tags_task = client.get(self.BASE_URL, params={
-                "method": "album.getTopTags",
-                "artist": artist,
-                "album": album,
-                "api_key": self.api_key,
-                "format": "json",
-                "autocorrect": 1,
-            })
-            artist_tags_task = client.get(self.BASE_URL, params={
-                "method": "artist.getTopTags",
-                "artist": artist,
-                "api_key": self.api_key,
-                "format": "json",
-                "autocorrect": 1,
-            })
-            similar_task = client.get(self.BASE_URL, params={
-                "method": "artist.getSimilar",
-                "artist": artist,
-                "api_key": self.api_key,
-                "format": "json",
-                "limit": 10,
-                "autocorrect": 1,
-            })
-            album_tags_resp, artist_tags_resp, similar_resp = await asyncio.gather(
-                album_tags_task, artist_tags_task, similar_task, return_exceptions=True
-            )
+        client = self.http_client
+        album_tags_task = client.get(self.BASE_URL, params={
+            "method": "album.getTopTags",
+            "artist": artist,
+            "album": album,
+            "api_key": self.api_key,
+            "format": "json",
+            "autocorrect": 1,
+        })
+        artist_tags_task = client.get(self.BASE_URL, params={
+            "method": "artist.getTopTags",
+            "artist": artist,
+            "api_key": self.api_key,
+            "format": "json",
+            "autocorrect": 1,
+        })
+        similar_task = client.get(self.BASE_URL, params={
+            "method": "artist.getSimilar",
+            "artist": artist,
+            "api_key": self.api_key,
+            "format": "json",
+            "limit": 10,
+            "autocorrect": 1,
+        })
+        album_tags_resp, artist_tags_resp, similar_resp = await asyncio.gather(
+            album_tags_task, artist_tags_task, similar_task, return_exceptions=True
+        )
 
         genres = []
         if isinstance(album_tags_resp, httpx.Response) and album_tags_resp.status_code == 200:
@@ -80,6 +86,12 @@ class SpotifyClient:
         self.api_base_url = "https://api.spotify.com/v1/"
         self.access_token = None
         self.token_expiry_time = 0
+        self._token_lock = asyncio.Lock()
+        # Shared across token refreshes and searches so connections are reused.
+        self.http_client = httpx.AsyncClient()
+
+    async def aclose(self):
+        await self.http_client.aclose()
 
     async def _get_access_token(self):
         """
@@ -88,18 +100,22 @@ class SpotifyClient:
         if self.access_token and time.time() < self.token_expiry_time:
             return
 
-        auth_string = f"{self.client_id}:{self.client_secret}"
-        auth_b64 = base64.b64encode(auth_string.encode()).decode()
+        # Concurrent requests that find the token expired share one refresh.
+        async with self._token_lock:
+            if self.access_token and time.time() < self.token_expiry_time:
+                return
 
-        headers = {
-            "Authorization": f"Basic {auth_b64}",
-            "Content-Type": "application/x-www-form-urlencoded",
-        }
-        data = {"grant_type": "client_credentials"}
+            auth_string = f"{self.client_id}:{self.client_secret}"
+            auth_b64 = base64.b64encode(auth_string.encode()).decode()
+
+            headers = {
+                "Authorization": f"Basic {auth_b64}",
+                "Content-Type": "application/x-www-form-urlencoded",
+            }
+            data = {"grant_type": "client_credentials"}
 
-        async with httpx.AsyncClient() as client:
             try:
-                response = await client.post(self.token_url, headers=headers, data=data)
+                response = await self.http_client.post(self.token_url, headers=headers, data=data)
                 response.raise_for_status()
                 token_data = response.json()
                 self.access_token = token_data["access_token"]
@@ -127,32 +143,30 @@ class SpotifyClient:
         search_params = {"q": search_query, "type": "album", "limit": 1, "market": "US"}
         logging.debug(f"Spotify search: '{search_query}'")
 
-        async with httpx.AsyncClient() as client:
-            try:
-                search_response = await client.get(
-                    f"{self.api_base_url}search", headers=headers, params=search_params
-                )
-                search_response.raise_for_status()
-                search_results = search_response.json()
-
-                items = search_results.get("albums", {}).get("items", [])
-                if not items:
-                    logging.warning(f"Spotify: no albums found for '{search_query}'")
-                    return None
-
-                album = items[0]
-                album_url = album.get("external_urls", {}).get("spotify")
-                if album_url:
-                    logging.info(f"Spotify: found '{album['name']}' → {album_url}")
-                    return album_url
-                else:
-                    logging.warning(f"Spotify: '{album['name']}' has no external URL")
-                    return None
+        try:
+            search_response = await self.http_client.get(
+                f"{self.api_base_url}search", headers=headers, params=search_params
+            )
+            search_response.raise_for_status()
+            search_results = search_response.json()
 
-            except httpx.RequestError as e:
-                logging.error(f"Spotify request error: {e}")
+            items = search_results.get("albums", {}).get("items", [])
+            if not items:
+                logging.warning(f"Spotify: no albums found for '{search_query}'")
                 return None
-            except Exception as e:
-                logging.error(f"Unexpected Spotify search error: {e}")
+
+            album = items[0]
+            album_url = album.get("external_urls", {}).get("spotify")
+            if album_url:
+                logging.info(f"Spotify: found '{album['name']}' → {album_url}")
+                return album_url
+            else:
+                logging.warning(f"Spotify: '{album['name']}' has no external URL")
                 return None
 
+        except httpx.RequestError as e:
+            logging.error(f"Spotify request error: {e}")
+            return None
+        except Exception as e:
+            logging.error(f"Unexpected Spotify search error: {e}")
+            return None
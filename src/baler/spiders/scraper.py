@@ -1,12 +1,21 @@
-import json
 import re
 from dataclasses import dataclass, field
 from pathlib import Path
 
+import orjson
 import scrapy
 
+# parse_review selectors, written as XPath so Parsel skips the per-call CSS translation.
+# These match the previous CSS selectors exactly.
+_ARTIST_A = '//div[contains(@class, "SplitScreenContentHeaderArtist")]//a/text()'
+_ARTIST_DIV = '//div[contains(@class, "SplitScreenContentHeaderArtist")]/text()'
+_TITLE = 'string(//h1[@data-testid="ContentHeaderHed"])'
+_AUTHOR = '//a[contains(@href, "/staff/")]/text()'
+_COVER = '//img[@loading="eager"]/@src'
+_BODY_P = '//div[contains(@class, "body__inner-container")]//p'
 
-@dataclass
+
+@dataclass(slots=True)
 class ReviewItem:
     artist: str
     album_title: str
@@ -49,14 +58,14 @@ class PitchforkSpider(scrapy.Spider):
         if previous_file and Path(previous_file).exists():
             self.logger.info(f"Loading previously seen URLs from {previous_file}")
             try:
-                with open(previous_file) as f:
+                with open(previous_file, "rb") as f:
                     for line in f:
                         try:
-                            review = json.loads(line)
-                            if 'review_url' in review:
-                                self.seen_urls.add(review['review_url'])
-                        except json.JSONDecodeError:
-                            self.logger.warning(f"Could not parse line: {line.strip()}")
+                            url = orjson.loads(line).get('review_url')
+                            if url:
+                                self.seen_urls.add(url)
+                        except orjson.JSONDecodeError:
+                            self.logger.warning(f"Could not parse line: {line.strip().decode(errors='replace')}")
                 self.logger.info(f"Loaded {len(self.seen_urls)} previously seen URLs.")
             except Exception as e:
                 self.logger.error(f"Error reading previous file: {e}")
@@ -70,23 +79,33 @@ class PitchforkSpider(scrapy.Spider):
                 yield scrapy.Request(url=url, callback=self.parse_review)
             return
 
-        # Normal mode: crawl listing pages with playwright
+        # Normal mode: listing pages are server-rendered, so fetch plain HTML first
         for url in self.start_urls:
-            yield scrapy.Request(
-                url=url,
-                meta=dict(
-                    playwright=True,
-                    playwright_include_page=True,
-                )
-            )
+            yield scrapy.Request(url=url, callback=self.parse)
+
+    def _render_with_playwright(self, response, callback):
+        """Re-request a page through Playwright when the plain HTML came back empty."""
+        self.logger.info(f"No content in static HTML, retrying with Playwright: {response.url}")
+        return response.request.replace(
+            callback=callback,
+            dont_filter=True,
+            meta=dict(
+                playwright=True,
+                playwright_include_page=True,
+            ),
+        )
 
     async def parse(self, response):
-        page = response.meta["playwright_page"]
+        page = response.meta.get("playwright_page")
+        review_links = response.css('a[href^="/reviews/albums/"]')
+
+        if not review_links and page is None:
+            yield self._render_with_playwright(response, self.parse)
+            return
+
         self.pages_crawled += 1
         found_seen_url_on_page = False
 
-        review_links = response.css('a[href^="/reviews/albums/"]')
-
         for link in review_links:
             href = link.attrib['href']
             # Skip the base listing URL and bare /reviews/albums/ links without a slug
@@ -116,30 +135,32 @@ class PitchforkSpider(scrapy.Spider):
                 next_page_num = int(match.group(1)) if match else 'unknown'
                 self.logger.info(f"Following link to page {next_page_num}")
 
-                yield scrapy.Request(
-                    url=response.urljoin(next_page_link),
-                    callback=self.parse,
-                    meta=dict(
-                        playwright=True,
-                        playwright_include_page=True,
-                    )
-                )
+                yield scrapy.Request(url=response.urljoin(next_page_link), callback=self.parse)
             else:
                 self.logger.info("Reached the last page of reviews.")
         else:
             if found_seen_url_on_page:
                 self.logger.info("Stopping pagination because previously scraped reviews were found on this page.")
 
-        await page.close()
+        if page is not None:
+            await page.close()
+
+    async def parse_review(self, response):
+        page = response.meta.get("playwright_page")
+        if page is not None:
+            await page.close()
+
+        album_title = response.xpath(_TITLE).get()
+        if not album_title and page is None:
+            yield self._render_with_playwright(response, self.parse_review)
+            return
 
-    def parse_review(self, response):
-        artist_name = response.css('div[class*="SplitScreenContentHeaderArtist"] a::text').get()
+        artist_name = response.xpath(_ARTIST_A).get()
         if not artist_name:
-            artist_name = response.css('div[class*="SplitScreenContentHeaderArtist"]::text').get()
+            artist_name = response.xpath(_ARTIST_DIV).get()
 
-        album_title = response.xpath('string(//h1[@data-testid="ContentHeaderHed"])').get()
-        author = response.css('a[href*="/staff/"]::text').get()
-        album_cover_url = response.css('img[loading="eager"]::attr(src)').get()
+        author = response.xpath(_AUTHOR).get()
+        album_cover_url = response.xpath(_COVER).get()
 
         # Score, BNM flag, and release year are JS-hydrated and wrong in SSR HTML.
         # Parse them from the embedded JSON data instead.
@@ -159,7 +180,8 @@ class PitchforkSpider(scrapy.Spider):
         if year_match:
             release_year = year_match.group(1)
 
-        paragraphs = response.css('div[class*="body__inner-container"] p::text').getall()
+        # string(.) flattens each paragraph in libxml2, keeping text inside inline <a>/<em> tags
+        paragraphs = response.xpath(_BODY_P).xpath('string(.)').getall()
         review_text = "\n".join(paragraphs)
 
         yield ReviewItem(
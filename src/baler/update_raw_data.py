@@ -1,9 +1,13 @@
-import json
+import hashlib
+import io
 import logging
-import os
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import boto3
-import pandas as pd
+import orjson
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError, NoCredentialsError
 
 from . import config
@@ -12,6 +16,22 @@ logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
+MB = 1024 * 1024
+
+# Shared by every download: objects over 8 MB are fetched as concurrent 8 MB
+# range-GETs instead of one sequential stream.
+_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * MB,
+    multipart_chunksize=8 * MB,
+    max_concurrency=4,
+    io_chunksize=256 * 1024,
+    use_threads=True,
+)
+
+# Matches an unescaped review_url value on a raw JSONL line. Quotes inside JSON
+# strings are always escaped, so this can only hit the real key.
+_REVIEW_URL_RE = re.compile(rb'"review_url"\s*:\s*"([^"\\]*)"')
+
 
 def get_processed_files() -> set:
     """Reads the log of already processed S3 files."""
@@ -25,34 +45,76 @@ def get_processed_files() -> set:
         return set()
 
 
-def log_processed_file(s3_key: str):
-    """Adds a new S3 file key to the processed log."""
+def log_processed_file(processed_log, s3_key: str):
+    """Adds a new S3 file key to the processed log, via a handle held open for the whole sync."""
     try:
-        with open(config.PROCESSED_FILES_LOG, "a") as f:
-            f.write(f"{s3_key}\n")
+        processed_log.write(f"{s3_key}\n")
     except Exception as e:
         logging.error(f"Could not write to {config.PROCESSED_FILES_LOG}: {e}")
 
 
-def get_local_seen_urls() -> set:
-    """Reads the master reviews.jsonl and returns a set of all review_urls."""
+def url_key(url: bytes) -> bytes:
+    """16-byte digest of a UTF-8 review URL; the seen-set stores these instead of full strings."""
+    return hashlib.blake2b(url, digest_size=16).digest()
+
+
+def get_local_seen_urls() -> set[bytes]:
+    """
+    Streams the master reviews.jsonl and returns the url_key of every review_url.
+    Only fixed-size digests are kept, so memory stays small however large the file grows.
+    """
     if not config.RAW_DATA_FILE.exists():
         return set()
+    seen_urls = set()
     try:
-        # Using pandas is efficient for large files
-        df = pd.read_json(config.RAW_DATA_FILE, lines=True)
-        if "review_url" in df.columns:
-            return set(df["review_url"])
-        else:
-            return set()
-    except ValueError:
-        logging.warning(
-            f"{config.RAW_DATA_FILE} is empty or malformed. Starting with an empty URL set."
-        )
-        return set()
+        with open(config.RAW_DATA_FILE, "rb") as f:
+            for i, line in enumerate(f):
+                try:
+                    url = orjson.loads(line).get("review_url")
+                except (orjson.JSONDecodeError, AttributeError):
+                    logging.warning(
+                        f"Skipping malformed line {i+1} in {config.RAW_DATA_FILE}"
+                    )
+                    continue
+                if url:
+                    seen_urls.add(url_key(url.encode()))
     except Exception as e:
         logging.error(f"Error reading {config.RAW_DATA_FILE}: {e}")
         return set()
+    return seen_urls
+
+
+def download_s3_files(s3_client, s3_keys: list[str]) -> dict[str, io.BytesIO]:
+    """
+    Downloads the given S3 keys into memory concurrently, S3_DOWNLOAD_WORKERS at a
+    time over the shared client. Daily scrapes are small JSONL files, so no temp
+    files are written. Returns {s3_key: buffer} for the downloads that succeeded;
+    failures are logged and left out.
+    """
+    buffers = {}
+    with ThreadPoolExecutor(max_workers=config.S3_DOWNLOAD_WORKERS) as pool:
+        futures = {}
+        for s3_key in s3_keys:
+            buffer = io.BytesIO()
+            logging.info(f"Downloading {s3_key}...")
+            future = pool.submit(
+                s3_client.download_fileobj,
+                config.S3_BUCKET_NAME,
+                s3_key,
+                buffer,
+                Config=_TRANSFER_CONFIG,
+            )
+            futures[future] = (s3_key, buffer)
+
+        for future in as_completed(futures):
+            s3_key, buffer = futures[future]
+            try:
+                future.result()
+                buffer.seek(0)
+                buffers[s3_key] = buffer
+            except Exception as e:
+                logging.error(f"Error downloading {s3_key}: {e}")
+    return buffers
 
 
 def sync_s3_to_local():
@@ -62,7 +124,15 @@ def sync_s3_to_local():
     """
     logging.info("Starting S3 sync process...")
     try:
-        s3_client = boto3.client("s3")
+        # boto3 clients are thread-safe; size the pool so every download worker
+        # and its multipart range-GETs get their own connection.
+        s3_client = boto3.client(
+            "s3",
+            config=Config(
+                max_pool_connections=config.S3_DOWNLOAD_WORKERS
+                * _TRANSFER_CONFIG.max_request_concurrency
+            ),
+        )
         processed_s3_files = get_processed_files()
 
         # --- THE FIX: Load all URLs we already have locally ---
@@ -71,63 +141,79 @@ def sync_s3_to_local():
             f"Loaded {len(local_seen_urls)} unique review URLs from local {config.RAW_DATA_FILE}."
         )
 
-        objects = s3_client.list_objects_v2(
+        # list_objects_v2 returns at most 1000 keys per call; page through the rest.
+        paginator = s3_client.get_paginator("list_objects_v2")
+        found_any = False
+        new_files_to_process = {}  # s3_key -> size in bytes
+        for page in paginator.paginate(
             Bucket=config.S3_BUCKET_NAME, Prefix=config.S3_DAILY_PREFIX
-        )
-        if "Contents" not in objects:
+        ):
+            for obj in page.get("Contents", ()):
+                found_any = True
+                s3_key = obj["Key"]
+                if obj["Size"] > 0 and s3_key not in processed_s3_files:
+                    new_files_to_process[s3_key] = obj["Size"]
+
+        if not found_any:
             logging.info(f"No files found in S3 at prefix {config.S3_DAILY_PREFIX}.")
             return
 
-        new_files_to_process = []
-        for obj in objects["Contents"]:
-            s3_key = obj["Key"]
-            if obj["Size"] > 0 and s3_key not in processed_s3_files:
-                new_files_to_process.append(s3_key)
-
         if not new_files_to_process:
             logging.info("No new S3 files found to process. Local data is up-to-date.")
             return
 
         logging.info(f"Found {len(new_files_to_process)} new S3 files to download...")
 
+        # Downloads are network-bound and run in parallel, largest first so a big
+        # file started last doesn't set the wall time. The merge below stays
+        # sequential and in key order so the dedup result is deterministic.
+        buffers = download_s3_files(
+            s3_client,
+            sorted(new_files_to_process, key=new_files_to_process.get, reverse=True),
+        )
+
         total_new_reviews_appended = 0
-        with open(config.RAW_DATA_FILE, "a") as master_file:
-            for s3_key in sorted(new_files_to_process):
+        # The log is opened first so it is closed last: reviews reach the master
+        # file before their S3 keys are recorded as processed.
+        with (
+            open(config.PROCESSED_FILES_LOG, "a", buffering=1 << 16) as processed_log,
+            open(config.RAW_DATA_FILE, "ab", buffering=1 << 20) as master_file,
+        ):
+            for s3_key in sorted(buffers):
                 try:
-                    local_temp_path = f"./temp_{os.path.basename(s3_key)}"
-                    logging.info(f"Downloading {s3_key}...")
-                    s3_client.download_file(
-                        config.S3_BUCKET_NAME, s3_key, local_temp_path
-                    )
-
                     logging.info(f"Scanning {s3_key} for new reviews...")
                     new_reviews_from_this_file = 0
 
                     # --- THE FIX: Check for duplicates before appending ---
-                    with open(local_temp_path) as temp_f:
-                        for line in temp_f:
-                            try:
-                                review = json.loads(line)
-                                url = review.get("review_url")
-                                if url and url not in local_seen_urls:
-                                    master_file.write(line)  # line already has newline
-                                    local_seen_urls.add(url)
-                                    new_reviews_from_this_file += 1
-                            except json.JSONDecodeError:
-                                logging.warning(
-                                    f"Skipping malformed line in {s3_key}: {line.strip()}"
-                                )
+                    for line in buffers.pop(s3_key):
+                        # Most lines in a daily scrape are already known; match the
+                        # URL on the raw bytes and only fully decode the rest.
+                        match = _REVIEW_URL_RE.search(line)
+                        if match and url_key(match.group(1)) in local_seen_urls:
+                            continue
+                        try:
+                            url = orjson.loads(line).get("review_url")
+                            if url and (key := url_key(url.encode())) not in local_seen_urls:
+                                if not line.endswith(b"\n"):
+                                    line += b"\n"
+                                master_file.write(line)
+                                local_seen_urls.add(key)
+                                new_reviews_from_this_file += 1
+                        except (orjson.JSONDecodeError, AttributeError):
+                            logging.warning(
+                                f"Skipping malformed line in {s3_key}: {line.strip().decode(errors='replace')}"
+                            )
 
                     logging.info(
                         f"Appended {new_reviews_from_this_file} new unique reviews from {s3_key}."
                     )
                     total_new_reviews_appended += new_reviews_from_this_file
 
-                    os.remove(local_temp_path)
-                    log_processed_file(s3_key)
+                    # Only record the key once its reviews have left the 1 MiB buffer;
+                    # if this flush fails the key stays unlogged and is retried next sync.
+                    master_file.flush()
+                    log_processed_file(processed_log, s3_key)
 
-                except ClientError as e:
-                    logging.error(f"Error downloading {s3_key}: {e}")
                 except Exception as e:
                     logging.error(f"Error processing {s3_key}: {e}")
 
@@ -1,4 +1,11 @@
+import asyncio
 import json
+import re
+
+# Sentence boundary: terminal punctuation followed by whitespace. Unlike a bare
+# split on '.', this keeps decimals ("8.5") and dotted names ("Mr.Oizo") intact
+# and also breaks on '!' and '?'.
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
 
 
 def parse_json_list(value, default: list | None = None) -> list:
@@ -17,13 +24,29 @@ def parse_json_list(value, default: list | None = None) -> list:
 
 def chunk_text(text: str, chunk_size: int = 4, overlap: int = 1) -> list[str]:
     """Splits text into overlapping chunks of sentences."""
-    sentences = [s.strip() for s in text.split('.') if s.strip()]
+    step = chunk_size - overlap
+    if step <= 0:
+        raise ValueError(f"overlap ({overlap}) must be smaller than chunk_size ({chunk_size})")
+
+    sentences = [s for s in _SENTENCE_BOUNDARY.split(text.strip()) if s]
     if not sentences:
         return []
 
     chunks = []
-    for i in range(0, len(sentences), chunk_size - overlap):
-        chunk = ". ".join(sentences[i:i + chunk_size])
+    for i in range(0, len(sentences), step):
+        chunk = " ".join(sentences[i:i + chunk_size])
         if chunk:
-            chunks.append(chunk + '.')
+            chunks.append(chunk)
     return chunks
+
+
+def run_async(main):
+    """
+    Runs a script's top-level coroutine on uvloop when it is installed (it ships
+    with uvicorn[standard]), falling back to the stdlib asyncio loop.
+    """
+    try:
+        import uvloop
+    except ImportError:
+        return asyncio.run(main)
+    return uvloop.run(main)